@@ -1,38 +1,386 @@
+import ast
+import json
+import mmap
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import BinaryIO, Callable
 
 import numpy as np
 from perfcapture.dataset import Dataset
 from perfcapture.metrics import MetricsForRun
 from perfcapture.workload import Workload
 
+_DIRECT_IO_ALIGNMENT = 4096
+_READ_CHUNK_SIZE = 16 << 20
+_RNG_BLOCK_LEN = 1 << 20  # Number of uint64s to draw at once when generating the dataset.
+_NPY_FILENAME = "data.npy"  # The NPY file within each `NumpyDataset` directory.
+
+# The NPY preamble is the magic string, then the major and minor version numbers.
+_NPY_PREAMBLE = struct.Struct("<6sBB")
+_NPY_HEADER_LEN_V1 = struct.Struct("<H")
+_NPY_HEADER_LEN_V2 = struct.Struct("<I")
+
+# Maps (path, mtime_ns, size) to (data_offset, dtype, shape, order). See `_read_npy_header`.
+_HEADER_CACHE: dict[tuple[str, int, int], tuple[int, np.dtype, tuple[int, ...], str]] = {}
+
+# Maps (sidecar path, mtime_ns, size) to (data_offset, dtype, shape, order).
+# See `_get_npy_layout`.
+_SIDECAR_CACHE: dict[tuple[str, int, int], tuple[int, np.dtype, tuple[int, ...], str]] = {}
+
 
 class NumpyDataset(Dataset):
+    # Optional path to an existing copy of this dataset's NPY file. If set (and the file
+    # exists) then `create` copies that file instead of generating a new random array.
+    # If the copy fails then `create` falls back to generating the array.
+    _source_cache_path: Path | None = None
+
+    # The shape of the (uint8) array to generate.
+    shape: tuple[int, ...] = (100, 100, 100, 100)
+
     def create(self) -> None:
-        """Create simple numpy file."""
-        array = _create_numpy_array()
-        with open(self.path, mode="wb") as fh:
-            np.save(fh, array)
+        """Create a directory holding a simple numpy file, and a JSON sidecar file.
+
+        The data region is aligned to `_DIRECT_IO_ALIGNMENT` so that it can be read
+        with `O_DIRECT` and memory-mapped at a page boundary. The sidecar records the
+        layout of the numpy file, so readers can skip parsing the NPY header. Both files
+        live in `self.path`, so they're created, flushed, evicted and deleted together.
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        npy_path = self.path / _NPY_FILENAME
+        layout = None
+        source = self._source_cache_path
+        if source is not None and source.exists() and hasattr(os, "copy_file_range"):
+            try:
+                _copy_file_in_kernel(source, npy_path)
+            except OSError:
+                # E.g. EXDEV across filesystems on old kernels, or EOPNOTSUPP on filesystems
+                # which don't support copy_file_range. Generate the array instead.
+                npy_path.unlink(missing_ok=True)
+            else:
+                layout = _read_npy_header(npy_path)
+        if layout is None:
+            array = _create_numpy_array(self.shape)
+            with open(npy_path, mode="wb") as fh:
+                data_offset = _write_aligned_npy_header(fh, array)
+                array.tofile(fh)
+            layout = (data_offset, array.dtype, array.shape, "C")
+        _write_sidecar(npy_path, layout)
     
 
 class ReadNumpyFile(Workload):
+    # If True, read the whole array into RAM. If False, just memory-map the file,
+    # which only reads the NPY header (so only measures the metadata overhead),
+    # unless `prefault_mmap` is also True.
+    force_materialize: bool = True
+
+    # Only used if `force_materialize` is False. If True, prefault every page of the
+    # memory-mapped file (so the whole file is read, via the mapping).
+    prefault_mmap: bool = False
+
+    # If True, read with `O_DIRECT`, which bypasses the page cache (so every run reads from
+    # disk, whatever the workload runner's cache mode). If False, read through the page cache.
+    use_direct_io: bool = False
+
     def init_datasets(self) -> tuple[Dataset, ...]:
         return (NumpyDataset(), )
     
     def run(self, dataset_path: Path) -> MetricsForRun:
-        """Load numpy file into RAM."""
-        arr = np.load(dataset_path)
+        """Load numpy file into RAM (or memory-map it, if not `force_materialize`)."""
+        arr = _fast_load_npy(
+            dataset_path / _NPY_FILENAME,
+            use_mmap=not self.force_materialize,
+            use_direct_io=self.use_direct_io,
+            prefault_mmap=self.prefault_mmap,
+            )
         return MetricsForRun(
             nbytes_in_final_array=arr.nbytes,
         )
+
+    def run_repeats(
+        self,
+        dataset_path: Path,
+        n_runs: int,
+        measure: Callable[[Callable[[], MetricsForRun]], None],
+        ) -> None:
+        """Get the layout of the numpy file once, and then time just the loads."""
+        npy_path = dataset_path / _NPY_FILENAME
+        layout = _get_npy_layout(npy_path)
+        use_mmap = not self.force_materialize
+        use_direct_io = self.use_direct_io
+        prefault_mmap = self.prefault_mmap
+
+        def run_once() -> MetricsForRun:
+            arr = _load_npy_data(npy_path, layout, use_mmap, use_direct_io, prefault_mmap)
+            return MetricsForRun(nbytes_in_final_array=arr.nbytes)
+
+        for _ in range(n_runs):
+            measure(run_once)
         
     @property
     def n_runs(self) -> int:
         return 10
 
 
-def _create_numpy_array() -> np.ndarray:
-    """Generate an array of random numbers."""
-    DTYPE = np.uint8
-    low, high = np.iinfo(DTYPE).min, np.iinfo(DTYPE).max
-    rng = np.random.default_rng()
-    return rng.integers(low=low, high=high, size=(100, 100, 100, 100), dtype=DTYPE)
\ No newline at end of file
+def _copy_file_in_kernel(src: Path, dst: Path) -> None:
+    """Copy `src` to `dst` using `os.copy_file_range`, so the data never enters user space."""
+    with open(src, mode="rb") as src_fh, open(dst, mode="wb") as dst_fh:
+        remaining = os.fstat(src_fh.fileno()).st_size
+        while remaining > 0:
+            n_copied = os.copy_file_range(src_fh.fileno(), dst_fh.fileno(), remaining)
+            if n_copied == 0:  # EOF
+                break
+            remaining -= n_copied
+
+
+def _write_aligned_npy_header(fh: BinaryIO, array: np.ndarray) -> int:
+    """Write an NPY version 1.0 header, padded so that the array data is page-aligned.
+
+    `np.save` only pads the header to a multiple of 64 bytes. The NPY format allows
+    any amount of space-padding before the terminating newline, so files written
+    this way can still be read by `np.load`.
+
+    Returns the offset of the array data from the start of the file.
+    """
+    header = repr(np.lib.format.header_data_from_array_1_0(array)).encode("latin1")
+    preamble_len = _NPY_PREAMBLE.size + _NPY_HEADER_LEN_V1.size
+    unpadded_len = preamble_len + len(header) + 1  # +1 for the terminating newline.
+    padded_len = -(-unpadded_len // _DIRECT_IO_ALIGNMENT) * _DIRECT_IO_ALIGNMENT
+    header_len = padded_len - preamble_len
+    header = header.ljust(header_len - 1) + b"\n"
+    fh.write(_NPY_PREAMBLE.pack(b"\x93NUMPY", 1, 0))
+    fh.write(_NPY_HEADER_LEN_V1.pack(header_len))
+    fh.write(header)
+    return padded_len
+
+
+def _fast_load_npy(
+    path: Path,
+    use_mmap: bool = False,
+    use_direct_io: bool = False,
+    prefault_mmap: bool = False,
+) -> np.ndarray:
+    """Load an NPY file without going through `np.load`.
+
+    `np.load` parses the header with a pure-Python tokenizer and then copies the data
+    through the file object in chunks. Instead, we parse the header ourselves and then
+    read the whole data region with `_read_region` (or, if `use_mmap` is True,
+    memory-map it with `_mmap_file`).
+    """
+    return _load_npy_data(path, _get_npy_layout(path), use_mmap, use_direct_io, prefault_mmap)
+
+
+def _load_npy_data(
+    path: Path,
+    layout: tuple[int, np.dtype, tuple[int, ...], str],
+    use_mmap: bool,
+    use_direct_io: bool = False,
+    prefault_mmap: bool = False,
+) -> np.ndarray:
+    """Load the data of the NPY file at `path`, given its layout from `_get_npy_layout`."""
+    data_offset, dtype, shape, order = layout
+    count = int(np.prod(shape))
+    if use_mmap:
+        buffer = _mmap_file(path, prefault_mmap)
+        arr = np.frombuffer(buffer, dtype=dtype, count=count, offset=data_offset)
+        return arr.reshape(shape, order=order)
+    data = _read_region(path, data_offset, dtype.itemsize * count, use_direct_io)
+    return np.frombuffer(data, dtype=dtype).reshape(shape, order=order)
+
+
+def _mmap_file(path: Path, prefault: bool = False) -> mmap.mmap:
+    """Memory-map the whole of `path`, read-only.
+
+    If `prefault` is False then no data is read until the mapping is accessed. If `prefault`
+    is True then every page is prefaulted: on Linux, `MAP_POPULATE` makes the kernel read the
+    file and populate the page tables in one batch, instead of taking one page fault per
+    4 KiB page on first access. Elsewhere, fall back to `madvise(MADV_WILLNEED)`, which at
+    least starts read-ahead.
+    """
+    with open(path, mode="rb") as fh:
+        if not prefault:
+            return mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(mmap, "MAP_POPULATE"):
+            return mmap.mmap(
+                fh.fileno(), 0,
+                flags=mmap.MAP_PRIVATE | mmap.MAP_POPULATE, prot=mmap.PROT_READ)
+        buffer = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(mmap, "MADV_WILLNEED"):
+            buffer.madvise(mmap.MADV_WILLNEED)
+        return buffer
+
+
+def _sidecar_path(path: Path) -> Path:
+    return path.with_suffix(".json")
+
+
+def _write_sidecar(path: Path, layout: tuple[int, np.dtype, tuple[int, ...], str]) -> None:
+    """Record the layout of the NPY file at `path` in its JSON sidecar file.
+
+    Structured dtypes can't be round-tripped through `dtype.str`, so for those any existing
+    sidecar is removed instead, and readers fall back to parsing the NPY header.
+    """
+    data_offset, dtype, shape, order = layout
+    sidecar_path = _sidecar_path(path)
+    if dtype.fields is not None:
+        sidecar_path.unlink(missing_ok=True)
+        return
+    metadata = {"shape": list(shape), "dtype": dtype.str, "offset": data_offset, "order": order}
+    with open(sidecar_path, mode="w", encoding="utf-8") as fh:
+        json.dump(metadata, fh)
+
+
+def _get_npy_layout(path: Path) -> tuple[int, np.dtype, tuple[int, ...], str]:
+    """Return the `(data_offset, dtype, shape, order)` of the NPY file at `path`.
+
+    Uses the JSON sidecar written by `NumpyDataset.create`, if there is one, which avoids
+    parsing the NPY header at all. Otherwise falls back to `_read_npy_header`. Like
+    `_read_npy_header`, results are cached, keyed on the sidecar's path, modification
+    time and size.
+    """
+    sidecar_path = _sidecar_path(path)
+    try:
+        stat = os.stat(sidecar_path)
+    except FileNotFoundError:
+        return _read_npy_header(path)
+    cache_key = (os.fspath(sidecar_path), stat.st_mtime_ns, stat.st_size)
+    try:
+        return _SIDECAR_CACHE[cache_key]
+    except KeyError:
+        pass
+    with open(sidecar_path, mode="r", encoding="utf-8") as fh:
+        metadata = json.load(fh)
+    layout = (
+        metadata["offset"], np.dtype(metadata["dtype"]), tuple(metadata["shape"]),
+        metadata["order"])
+    _SIDECAR_CACHE[cache_key] = layout
+    return layout
+
+
+def _read_npy_header(path: Path) -> tuple[int, np.dtype, tuple[int, ...], str]:
+    """Return the `(data_offset, dtype, shape, order)` of the NPY file at `path`.
+
+    Results are cached, keyed on the file's path, modification time and size, so
+    repeated runs against an unchanged file skip parsing the header.
+    """
+    stat = os.stat(path)
+    cache_key = (os.fspath(path), stat.st_mtime_ns, stat.st_size)
+    try:
+        return _HEADER_CACHE[cache_key]
+    except KeyError:
+        pass
+
+    with open(path, mode="rb") as fh:
+        magic, major_version, _ = _NPY_PREAMBLE.unpack(fh.read(_NPY_PREAMBLE.size))
+        if magic != b"\x93NUMPY":
+            raise ValueError(f"{path} is not an NPY file!")
+        header_len_struct = _NPY_HEADER_LEN_V1 if major_version == 1 else _NPY_HEADER_LEN_V2
+        (header_len,) = header_len_struct.unpack(fh.read(header_len_struct.size))
+        header = ast.literal_eval(fh.read(header_len).decode("latin1"))
+        data_offset = fh.tell()
+    order = "F" if header["fortran_order"] else "C"
+    parsed_header = (data_offset, np.dtype(header["descr"]), header["shape"], order)
+    _HEADER_CACHE[cache_key] = parsed_header
+    return parsed_header
+
+
+def _read_region(path: Path, offset: int, nbytes: int, use_direct_io: bool = False) -> np.ndarray:
+    """Read `nbytes` from `path`, starting at `offset`, into a new uint8 array.
+
+    The data is read in large chunks with `os.preadv`, straight into the numpy buffer, which
+    avoids any intermediate copies. Reads go through the page cache, so whatever the workload
+    runner left in the page cache is what gets measured.
+
+    If `use_direct_io` is True then, on Linux, the file is opened with `O_DIRECT`, which
+    bypasses the page cache. Falls back to a normal read where `O_DIRECT` is not available
+    (e.g. non-Linux platforms, or filesystems like tmpfs).
+    """
+    if use_direct_io and hasattr(os, "O_DIRECT") and hasattr(os, "preadv"):
+        try:
+            return _read_with_o_direct(path, offset, nbytes)
+        except OSError:
+            pass
+    buffer = np.empty(nbytes, dtype=np.uint8)
+    with open(path, mode="rb", buffering=0) as fh:
+        _advise_sequential(fh.fileno(), offset, nbytes)
+        if hasattr(os, "preadv"):
+            _preadv_into(fh.fileno(), buffer, offset)
+        else:
+            fh.seek(offset)
+            view = memoryview(buffer)
+            pos = 0
+            while pos < nbytes:
+                n_read = fh.readinto(view[pos:])
+                if not n_read:  # EOF
+                    break
+                pos += n_read
+    return buffer
+
+
+def _advise_sequential(fd: int, offset: int, nbytes: int) -> None:
+    """Tell the kernel that we're about to read this region sequentially.
+
+    This enlarges the kernel's read-ahead window and starts reading the region
+    into the page cache straight away.
+    """
+    if hasattr(os, "posix_fadvise"):
+        os.posix_fadvise(fd, offset, nbytes, os.POSIX_FADV_SEQUENTIAL)
+        os.posix_fadvise(fd, offset, nbytes, os.POSIX_FADV_WILLNEED)
+
+
+def _read_with_o_direct(path: Path, offset: int, nbytes: int) -> np.ndarray:
+    # O_DIRECT requires the file offset, the read length and the memory address
+    # to all be aligned, so we read a slightly larger, aligned region.
+    align = _DIRECT_IO_ALIGNMENT
+    aligned_start = offset - (offset % align)
+    aligned_len = -(-(offset + nbytes - aligned_start) // align) * align
+    raw = np.empty(aligned_len + align, dtype=np.uint8)
+    misalignment = raw.ctypes.data % align
+    buffer = raw[(align - misalignment) % align:][:aligned_len]
+
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECT)
+    try:
+        _preadv_into(fd, buffer, aligned_start)
+    finally:
+        os.close(fd)
+    start = offset - aligned_start
+    return buffer[start:start + nbytes]
+
+
+def _preadv_into(fd: int, buffer: np.ndarray, offset: int) -> None:
+    """Fill `buffer` from `fd`, starting at file offset `offset`, in `_READ_CHUNK_SIZE` chunks."""
+    pos = 0
+    while pos < buffer.size:
+        chunk = memoryview(buffer[pos:pos + _READ_CHUNK_SIZE])
+        n_read = os.preadv(fd, [chunk], offset + pos)
+        if n_read == 0:  # EOF
+            break
+        pos += n_read
+
+
+def _create_numpy_array(shape: tuple[int, ...]) -> np.ndarray:
+    """Generate an array of random bytes.
+
+    Each thread fills its own slice of a preallocated array, using an independent
+    random number generator. numpy's generators release the GIL, so this uses all cores.
+    We draw 64-bit integers (which is what PCG64 natively produces) and reinterpret
+    each one as eight uint8s, which is much faster than drawing uint8s one at a time.
+    """
+    nbytes = int(np.prod(shape))
+    words = np.empty(-(-nbytes // 8), dtype=np.uint64)
+    n_threads = os.cpu_count() or 1
+    seeds = np.random.SeedSequence().spawn(n_threads)
+    chunk_len = -(-words.size // n_threads)
+
+    def fill_chunk(i: int) -> None:
+        chunk = words[i * chunk_len:(i + 1) * chunk_len]
+        rng = np.random.default_rng(seeds[i])
+        # Fill in blocks, so the temporary arrays returned by `integers` stay small.
+        for start in range(0, chunk.size, _RNG_BLOCK_LEN):
+            block = chunk[start:start + _RNG_BLOCK_LEN]
+            block[:] = rng.integers(0, 1 << 64, size=block.size, dtype=np.uint64)
+
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        list(executor.map(fill_chunk, range(n_threads)))
+    return words.view(np.uint8)[:nbytes].reshape(shape)
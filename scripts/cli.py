@@ -1,12 +1,12 @@
 #!/usr/bin/env python
+import logging
 import pathlib
-import shutil
 import sys
-import time
 from typing import Optional
 
 import pandas as pd
 import typer
+from perfcapture import cache
 from perfcapture.dataset import create_datasets_if_necessary
 from perfcapture.workload import discover_workloads, run_workloads
 from typing_extensions import Annotated
@@ -45,7 +45,9 @@ def bench(
     keep_cache: Annotated[
         bool, 
         typer.Option(
-            help="Set this flag to prevent `vmtouch -e` being called before each benchmark.",
+            help="Set this flag to prevent the dataset being evicted from the page cache"
+            " before each benchmark. Workloads whose `cache_mode` is TOUCH still read their"
+            " dataset into the page cache before each benchmark.",
             )
         ] = False,
     ) -> None:
@@ -57,44 +59,46 @@ def bench(
     be removed after running this script. So if you run this script multiple times then subsequent
     runs can make use of the already existing datasets.
     
+    Newly created datasets are flushed to disk and evicted from the page cache before any
+    benchmarks run. To evict datasets using `vmtouch -e` instead, set the environment variable
+    PERFCAPTURE_USE_VMTOUCH=1 (vmtouch must be installed).
+    
     If you update the recipe which specifies the dataset creation then it is up to you to manually
     delete the old dataset on disk.
-    
-    vmtouch must be installed if you wish to clear the page cache after each iteration.
     """
+    # The perfcapture package logs its progress messages at INFO level.
+    logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stdout)
+
     # Sanity checks
     if not data_path.exists():
         sys.exit(f"ERROR! {data_path} does not exist! Please create the directory!")
     if not recipe_path.exists():
         sys.exit(f"ERROR! {recipe_path} does not exist!")
-    if shutil.which("vmtouch") is None:  # Check if vmtouch has been installed.
+    if not keep_cache and not cache.can_evict():
         sys.exit(
-            "If you want to flush the page cache before each iteration, then please install"
-            " vmtouch. Or run with the --keep-cache option, which does not call vmtouch.")
+            "ERROR! Cannot evict datasets from the page cache on this platform. Please install"
+            " vmtouch and set PERFCAPTURE_USE_VMTOUCH=1. Or run with the --keep-cache option.")
     
     workloads = discover_workloads(recipe_path)
     print(f"Found {len(workloads)} Workload class(es) in {recipe_path}")
 
     # Filter workloads (if necessary).
     if selected_workloads:
-        selected_workloads: list[str] = selected_workloads.split(" ")
-        workloads = filter(lambda workload: workload.name in selected_workloads, workloads)
-        workloads = list(workloads)
+        selected_workload_names = frozenset(selected_workloads.split())
+        workloads = [
+            workload for workload in workloads if workload.name in selected_workload_names]
         print("Workloads after filtering: ", workloads)
 
     # Filter datasets (if necessary).
     if selected_datasets:
-        selected_datasets: list[str] = selected_datasets.split(" ")
+        selected_dataset_names = frozenset(selected_datasets.split())
         for workload in workloads:
-            datasets = workload.datasets
-            print([dataset.name for dataset in datasets])
-            datasets = filter(lambda dataset: dataset.name in selected_datasets, datasets)
-            workload.datasets = tuple(datasets)
+            print([dataset.name for dataset in workload.datasets])
+            workload.datasets = tuple(
+                dataset for dataset in workload.datasets
+                if dataset.name in selected_dataset_names)
 
-    created_at_least_1_dataset: bool = create_datasets_if_necessary(workloads, data_path)
-    if created_at_least_1_dataset:
-        print("Waiting for data to be flushed to disk...")
-        time.sleep(10)
+    create_datasets_if_necessary(workloads, data_path)
 
     all_results: pd.DataFrame = run_workloads(workloads, keep_cache)
     all_results.to_csv(csv_filename)
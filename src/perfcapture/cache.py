@@ -0,0 +1,137 @@
+"""Control whether datasets are resident in the operating system's page cache."""
+
+import concurrent.futures
+import enum
+import functools
+import os
+import pathlib
+import shutil
+import subprocess
+from typing import Callable
+
+from perfcapture.utils import iter_files
+
+# Set this environment variable (to any non-empty value) to evict datasets from the page
+# cache by calling `vmtouch -e`, instead of calling `posix_fadvise` directly.
+_USE_VMTOUCH_ENV_VAR = "PERFCAPTURE_USE_VMTOUCH"
+
+# Look up vmtouch once, rather than searching PATH every time we evict a dataset.
+_VMTOUCH = shutil.which("vmtouch")
+
+_TOUCH_CHUNK_SIZE = 1 << 20  # The number of bytes that `touch` reads at a time.
+
+
+def can_evict() -> bool:
+    """Returns True if `evict` is supported on this platform."""
+    if os.environ.get(_USE_VMTOUCH_ENV_VAR):
+        return _VMTOUCH is not None
+    return hasattr(os, "posix_fadvise")
+
+
+def evict(path: pathlib.Path) -> None:
+    """Ask the kernel to drop `path` (a file, or a directory of files) from the page cache.
+
+    This is what `vmtouch -e` does. Dirty pages cannot be evicted, so `os.fsync` any
+    file which has just been written before calling this. Raises `RuntimeError` on
+    platforms without `os.posix_fadvise` (unless `vmtouch` is enabled; see
+    `_USE_VMTOUCH_ENV_VAR`), so cold-cache benchmarks never silently run warm.
+    """
+    if os.environ.get(_USE_VMTOUCH_ENV_VAR):
+        vmtouch = _VMTOUCH
+        if vmtouch is None:
+            raise RuntimeError(
+                f"{_USE_VMTOUCH_ENV_VAR} is set, but vmtouch could not be found on the PATH.")
+        _run_vmtouch_evict(vmtouch, path)
+    elif hasattr(os, "posix_fadvise"):
+        _advise_all_files(path, os.POSIX_FADV_DONTNEED)
+    else:
+        raise RuntimeError(
+            "Cannot evict datasets from the page cache on this platform, because"
+            f" os.posix_fadvise is not available. Install vmtouch and set {_USE_VMTOUCH_ENV_VAR}=1,"
+            " or don't evict datasets (e.g. run the CLI with --keep-cache).")
+
+
+def warm(path: pathlib.Path) -> None:
+    """Ask the kernel to start reading `path` (a file, or a directory of files) into the page cache.
+
+    The reads happen asynchronously, so the data may not be fully cached when this returns.
+    Does nothing on platforms without `os.posix_fadvise`.
+    """
+    if hasattr(os, "posix_fadvise"):
+        _advise_all_files(path, os.POSIX_FADV_WILLNEED)
+
+
+def touch(path: pathlib.Path) -> None:
+    """Read all of `path` (a file, or a directory of files) into the page cache.
+
+    Unlike `warm`, this only returns once every page has been read.
+    """
+    _for_each_file(path, _touch_file)
+
+
+class CacheMode(enum.Enum):
+    """How the page cache is prepared before each run of a workload."""
+
+    COLD = "cold"
+    """Evict the dataset from the page cache (see `evict`)."""
+
+    WARM = "warm"
+    """Leave the page cache alone. Whatever was cached by previous runs stays cached."""
+
+    TOUCH = "touch"
+    """Read the entire dataset into the page cache (see `touch`)."""
+
+
+def _run_vmtouch_evict(vmtouch: str, path: pathlib.Path) -> None:
+    args = [vmtouch, "-e", os.fspath(path)]
+    if not hasattr(os, "posix_spawn"):
+        # Discard vmtouch's stdout (which we never read), but keep stderr for error messages.
+        subprocess.run(args, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
+        return
+    # Unlike fork, posix_spawn doesn't duplicate this process's page tables, which can be
+    # large when the benchmark holds big arrays in memory. vmtouch's stdout is discarded,
+    # and its stderr goes to our stderr.
+    pid = os.posix_spawn(
+        vmtouch, args, os.environ,
+        file_actions=[(os.POSIX_SPAWN_OPEN, 1, os.devnull, os.O_WRONLY, 0)],
+        )
+    _, wait_status = os.waitpid(pid, 0)
+    returncode = os.waitstatus_to_exitcode(wait_status)
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, args)
+
+
+def _advise_all_files(path: pathlib.Path, advice: int) -> None:
+    _for_each_file(path, functools.partial(_advise, advice=advice))
+
+
+def _for_each_file(path: pathlib.Path, func: Callable[[pathlib.Path], None]) -> None:
+    """Call `func` on every file in `path`, in parallel if there's more than one file."""
+    filenames = list(iter_files(path))
+    if len(filenames) <= 1:
+        for filename in filenames:
+            func(filename)
+        return
+    # File I/O and `os.posix_fadvise` release the GIL, so process many files in parallel.
+    max_workers = min(len(filenames), os.cpu_count() or 1)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for future in [executor.submit(func, filename) for filename in filenames]:
+            future.result()
+
+
+def _advise(filename: pathlib.Path, advice: int) -> None:
+    fd = os.open(filename, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, advice)
+    finally:
+        os.close(fd)
+
+
+def _touch_file(filename: pathlib.Path) -> None:
+    buffer = bytearray(_TOUCH_CHUNK_SIZE)
+    with open(filename, "rb", buffering=0) as file:
+        if hasattr(os, "posix_fadvise"):
+            # Encourage the kernel to read ahead aggressively.
+            os.posix_fadvise(file.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        while file.readinto(buffer):
+            pass
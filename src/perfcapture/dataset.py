@@ -1,7 +1,13 @@
 import abc
+import concurrent.futures
+import logging
+import os
 import pathlib
 
-from perfcapture.utils import path_not_empty
+from perfcapture import cache
+from perfcapture.utils import iter_files, path_not_empty
+
+logger = logging.getLogger(__name__)
 
 
 class Dataset(abc.ABC):
@@ -21,6 +27,26 @@ class Dataset(abc.ABC):
                 dataset.create()
         """
 
+    def finalize(self) -> None:
+        """Flush the newly created dataset to disk, and evict it from the page cache.
+        
+        The workload runner calls this immediately after `create()`, so benchmarks
+        start with the dataset safely on disk rather than in dirty pages in RAM.
+        Override this method if your dataset needs different treatment.
+        """
+        for filename in iter_files(self.path):
+            fd = os.open(filename, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        if cache.can_evict():
+            cache.evict(self.path)
+        else:
+            logger.warning(
+                "Cannot evict %s from the page cache on this platform, so it may still be"
+                " cached when the first benchmark runs.", self.name)
+
     def already_exists(self) -> bool:
         """Returns True if the dataset is already on disk."""
         path_is_dir_which_is_not_empty = (
@@ -60,19 +86,43 @@ class Dataset(abc.ABC):
 def create_datasets_if_necessary(workloads: list, data_path: pathlib.Path) -> bool:
     """Create datasets if they do not already exist.
     
+    Datasets are independent of each other, so any datasets which need creating
+    are created concurrently, in a thread pool. Datasets with the same `name` are
+    only created once.
+    
     Returns True if it created any datasets.
     """
-    all_datasets = set()
+    # Different workloads may use different instances of the same dataset. Every
+    # instance needs its path set, but each dataset must only be created once.
+    # Datasets are identified by their name, and kept in a stable order.
+    datasets_by_name: dict[str, Dataset] = {}
     for workload in workloads:
-        all_datasets.update(workload.datasets)
-    print(f"Found {len(all_datasets)} Dataset object(s).")
-    created_at_least_1_dataset = False
-    for dataset in all_datasets:
-        dataset.set_path(data_path)
+        for dataset in workload.datasets:
+            dataset.set_path(data_path)
+            datasets_by_name.setdefault(dataset.name, dataset)
+    logger.info("Found %d Dataset(s).", len(datasets_by_name))
+    datasets_to_create = []
+    for dataset in datasets_by_name.values():
         if dataset.already_exists():
-            print(f"{dataset.name} already exists.")
+            logger.info("%s already exists.", dataset.name)
         else:
-            print(f"Creating dataset for {dataset.name}")
-            dataset.create()
-            created_at_least_1_dataset = True
-    return created_at_least_1_dataset
+            datasets_to_create.append(dataset)
+
+    if not datasets_to_create:
+        return False
+
+    max_workers = min(len(datasets_to_create), os.cpu_count() or 1)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        future_to_dataset = {}
+        for dataset in datasets_to_create:
+            logger.info("Creating dataset for %s", dataset.name)
+            future_to_dataset[executor.submit(_create_and_finalize, dataset)] = dataset
+        for future in concurrent.futures.as_completed(future_to_dataset):
+            future.result()  # Re-raise any exception raised by `_create_and_finalize`.
+            logger.info("Finished creating %s", future_to_dataset[future].name)
+    return True
+
+
+def _create_and_finalize(dataset: Dataset) -> None:
+    dataset.create()
+    dataset.finalize()
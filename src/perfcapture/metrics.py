@@ -2,7 +2,7 @@ import pathlib
 from dataclasses import dataclass
 
 
-@dataclass
+@dataclass(slots=True)
 class MetricsForRun:
     """Record metrics for each run."""
     nbytes_in_final_array: int
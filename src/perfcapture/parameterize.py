@@ -29,24 +29,37 @@ def parameterize(
     See pytest's docs on the parameterize mark:
     https://docs.pytest.org/en/7.3.x/how-to/parametrize.html
     """
-    argnames = argnames.split(',')
-    
-    # Convert a singular argvalue to a tuple of length 1:
-    if len(argnames) == 1:
-        for i, argvalue in enumerate(argvalues):
-            argvalues[i] = (argvalue,)
-
-    # Sanity check
-    for argvalue in argvalues:
-        assert len(argvalue) == len(argnames)
+    all_param_kwargs = _params_to_kwargs(argnames, argvalues)
 
     def decorator_parameterize(func: Callable) -> Callable:
         @functools.wraps(func)
         def wrapper_parameterize(*args, **kwargs) -> None:
-            for argvalue in argvalues:
-                modified_kwargs = kwargs.copy()
-                for i, argname in enumerate(argnames):
-                    modified_kwargs.setdefault(argname, argvalue[i])
-                func(*args, **modified_kwargs)
+            for param_kwargs in all_param_kwargs:
+                # kwargs passed in by the caller take precedence over the parameters.
+                func(*args, **{**param_kwargs, **kwargs})
         return wrapper_parameterize
-    return decorator_parameterize
\ No newline at end of file
+    return decorator_parameterize
+
+
+def _params_to_kwargs(
+    argnames: str,
+    argvalues: Iterable[Union[Sequence[object], object]]) -> tuple[dict[str, object], ...]:
+    """Map the argnames to each set of argvalues, once, rather than on every call.
+    
+    >>> _params_to_kwargs("foo,bar", [(1, 2), (3, 4)])
+    ({'foo': 1, 'bar': 2}, {'foo': 3, 'bar': 4})
+    >>> _params_to_kwargs("baz", [1, 2])
+    ({'baz': 1}, {'baz': 2})
+    """
+    argnames_tuple = tuple(argnames.split(','))
+    
+    # Convert a singular argvalue to a tuple of length 1:
+    if len(argnames_tuple) == 1:
+        argvalues_tuple = tuple((argvalue,) for argvalue in argvalues)
+    else:
+        argvalues_tuple = tuple(tuple(argvalue) for argvalue in argvalues)
+
+    # Sanity check
+    assert all(len(argvalue) == len(argnames_tuple) for argvalue in argvalues_tuple)
+
+    return tuple(dict(zip(argnames_tuple, argvalue)) for argvalue in argvalues_tuple)
@@ -1,16 +1,29 @@
 import abc
+import functools
+import logging
 import pathlib
 from collections import namedtuple
 from dataclasses import InitVar, dataclass, field
-from datetime import datetime
+from time import perf_counter_ns
+from typing import Iterable
 
 import numpy as np
 import pandas as pd
-import psutil
 
 from perfcapture.metrics import MetricsForRun
 
+logger = logging.getLogger(__name__)
+
 _NAME_MEAN_STD_STRING = "{:>18}: mean = {:>9.3f}; std = {:>9.3f}\n"
+# The fields of the named tuples returned by `psutil.disk_io_counters()` on Linux. See:
+# https://psutil.readthedocs.io/en/latest/#psutil.disk_io_counters
+# https://www.kernel.org/doc/Documentation/iostats.txt
+_SDISKIO_FIELDS = (
+    "read_count", "write_count", "read_bytes", "write_bytes", "read_time", "write_time",
+    "read_merged_count", "write_merged_count", "busy_time")
+_PROC_DISKSTATS = pathlib.Path("/proc/diskstats")
+_SECTOR_SIZE_BYTES = 512  # /proc/diskstats always counts 512-byte sectors.
+_INITIAL_CAPACITY = 64  # The initial number of runs that each perf counter has space for.
 
 
 class _PerfCounterABC(abc.ABC):
@@ -20,25 +33,77 @@ class _PerfCounterABC(abc.ABC):
     1. Init PerfCounter subclass when we start benchmarking a specific
        combination of <Workload> and <Dataset>.
     2. Set `PerfCounter.dataset_path` if this perf counter needs to know the dataset path.
-    3. Call `start_timing_iteration()` at the start of each iteration.
-    4. Call `stop_timing_iteration()` at the end of each iteration.
+    3. Call `start_timing_run()` at the start of each run.
+    4. Call `stop_timing_run(metrics_for_run, total_secs)` at the end of each run.
     5. Call `get_results()` at the end of the `run`, to get a `pd.DataFrame` of results.
+    
+    If the number of runs is known in advance, call `reserve(n_runs)` before the first run.
     """
     def __init__(self) -> None:
-        self._data_per_run = pd.DataFrame(columns=[self.name])
-        self._data_per_run.index.name = "run_ID"
+        self._set_schema({self.name: np.float64})
         self._dataset_path: pathlib.Path | None = None
+
+    def _set_schema(self, schema: dict[str, type]) -> None:
+        """Set the names and dtypes of the columns recorded by this counter.
+
+        Appending rows to a DataFrame copies the DataFrame each time. So, instead, results are
+        stored as a struct of arrays: one preallocated numpy array per column, which doubles
+        in size whenever it fills up. The DataFrame is only built in `get_results()`.
+        """
+        self._columns: dict[str, np.ndarray] = {
+            column: np.empty(_INITIAL_CAPACITY, dtype=dtype) for column, dtype in schema.items()}
+        self._run_ids = np.empty(_INITIAL_CAPACITY, dtype=np.int64)
+        self._n_rows = 0
+        self._cached_results: pd.DataFrame | None = None
         
     def start_timing_run(self) -> None:
         pass
 
     @abc.abstractmethod
-    def stop_timing_run(self, metrics_for_iteration: MetricsForRun) -> None:
+    def stop_timing_run(self, metrics_for_run: MetricsForRun, total_secs: float) -> None:
         pass
     
     def get_results(self) -> pd.DataFrame:
-        """Return a DataFrame where columns are counters, and rows are runs."""
-        return self._data_per_run
+        """Return a DataFrame where columns are counters, and rows are runs.
+        
+        The DataFrame is only rebuilt if rows have been added since the last call.
+        """
+        n = self._n_rows
+        if self._cached_results is None or len(self._cached_results) != n:
+            self._cached_results = pd.DataFrame(
+                self._get_columns(),
+                index=pd.Index(self._run_ids[:n], name="run_ID"),
+                copy=False,
+                )
+        return self._cached_results
+
+    def _get_columns(self) -> dict[str, np.ndarray]:
+        """Return a dict mapping each column name to a (zero-copy) array of per-run values."""
+        n = self._n_rows
+        return {column: values[:n] for column, values in self._columns.items()}
+
+    def reserve(self, n_runs: int) -> None:
+        """Resize the storage to hold exactly `n_runs` runs (if the number of runs is known).
+
+        More runs can still be recorded, but each time the storage fills up it is reallocated.
+        """
+        self._resize(max(n_runs, self._n_rows, 1))
+
+    def _resize(self, new_capacity: int) -> None:
+        if new_capacity == len(self._run_ids):
+            return
+        self._run_ids = np.resize(self._run_ids, new_capacity)
+        for column, values in self._columns.items():
+            self._columns[column] = np.resize(values, new_capacity)
+
+    def _append_row(self, run_id: int, row: dict[str, float]) -> None:
+        i = self._n_rows
+        if i == len(self._run_ids):
+            self._resize(2 * i)
+        self._run_ids[i] = run_id
+        for column, values in self._columns.items():
+            values[i] = row[column]
+        self._n_rows += 1
 
     @property
     def name(self) -> str:
@@ -54,45 +119,68 @@ class _PerfCounterABC(abc.ABC):
 
 @dataclass
 class PerfCounterManager:
-    """Simple manager for multiple performance counters."""
+    """Simple manager for multiple performance counters.
+    
+    `n_runs` is the expected number of runs, used to preallocate the counters' storage.
+    """
     dataset_path: InitVar[pathlib.Path]
     counters: list[_PerfCounterABC] = field(
         default_factory=lambda: [Runtime(), BandwidthToNumpy(), DiskIO()]
         )
+    n_runs: InitVar[int | None] = None
     
-    def __post_init__(self, dataset_path: pathlib.Path) -> None:
+    def __post_init__(self, dataset_path: pathlib.Path, n_runs: int | None) -> None:
         self._run_id: int = 0
+        self._cached_results: pd.DataFrame | None = None
         for counter in self.counters:
             counter.dataset_path = dataset_path
+            if n_runs is not None:
+                counter.reserve(n_runs)
+        # Look up the counters' bound methods once, rather than on every run.
+        self._start_timing_run_methods = tuple(
+            counter.start_timing_run for counter in self.counters)
+        self._stop_timing_run_methods = tuple(
+            counter.stop_timing_run for counter in self.counters)
 
     def start_timing_run(self) -> None:
         self._run_id += 1
-        [counter.start_timing_run() for counter in self.counters]
+        for start_timing_run in self._start_timing_run_methods:
+            start_timing_run()
         self._timer = _BasicTimer()
         
     def stop_timing_run(self, metrics_for_run: MetricsForRun) -> None:
         # Many counters require a runtime. So compute the runtime once, here.
-        metrics_for_run.total_secs = self._timer.total_secs_elapsed()
+        total_secs = self._timer.total_secs_elapsed()
+        metrics_for_run.total_secs = total_secs
         metrics_for_run.run_id = self._run_id
-        [counter.stop_timing_run(metrics_for_run) for counter in self.counters]
+        for stop_timing_run in self._stop_timing_run_methods:
+            stop_timing_run(metrics_for_run, total_secs)
+        self._cached_results = None
     
     def get_results(self) -> pd.DataFrame:
-        return pd.concat(
-            [counter.get_results() for counter in self.counters],
-            axis="columns",
-            )
+        # Every counter records every run, and run IDs count up from 1. So there's no
+        # need to align the counters' indexes: just merge all their columns into one frame.
+        if self._cached_results is None:
+            columns = {}
+            for counter in self.counters:
+                columns.update(counter._get_columns())
+            self._cached_results = pd.DataFrame(
+                columns,
+                index=pd.RangeIndex(1, self._run_id + 1, name="run_ID"),
+                copy=False,
+                )
+        return self._cached_results
         
     def get_summary_of_results(self) -> pd.DataFrame:
-        results = self.get_results()
-        return pd.DataFrame({'mean': results.mean(), 'std': results.std()})
+        return self.get_results().agg(['mean', 'std']).T
     
     def __str__(self) -> str:
         return str(self.get_summary_of_results())
 
 
 class Runtime(_PerfCounterABC):
-    def stop_timing_run(self, metrics_for_run: MetricsForRun) -> None:
-        self._data_per_run.loc[metrics_for_run.run_id] = metrics_for_run.total_secs
+    def stop_timing_run(self, metrics_for_run: MetricsForRun, total_secs: float) -> None:
+        self._append_row(metrics_for_run.run_id, {self.name: total_secs})
         
     @property
     def name(self) -> str:
@@ -100,10 +188,9 @@ class Runtime(_PerfCounterABC):
 
 
 class BandwidthToNumpy(_PerfCounterABC):
-    def stop_timing_run(self, metrics_for_run: MetricsForRun) -> None:
-        bytes_per_sec = metrics_for_run.nbytes_in_final_array / metrics_for_run.total_secs
-        gigabytes_per_sec = bytes_per_sec / 1E9
-        self._data_per_run.loc[metrics_for_run.run_id] = gigabytes_per_sec
+    def stop_timing_run(self, metrics_for_run: MetricsForRun, total_secs: float) -> None:
+        gigabytes_per_sec = metrics_for_run.nbytes_in_final_array * 1e-9 / total_secs
+        self._append_row(metrics_for_run.run_id, {self.name: gigabytes_per_sec})
         
     @property
     def name(self) -> str:
@@ -118,26 +205,56 @@ class DiskIO(_PerfCounterABC):
     all processes. So, if other processes are using this disk then
     you'll get misleading results!
     
+    The raw counters are not adjusted for wrap-around (psutil's `nowrap` option
+    keeps extra state and does extra work on every call). We assume that each run
+    is short enough that the kernel's counters do not wrap during the run.
+    
     For more information on the fields recorded, please see:
     - https://psutil.readthedocs.io/en/latest/#psutil.disk_io_counters
     - https://www.kernel.org/doc/Documentation/iostats.txt
     """
+    # Raw psutil fields which are replaced by columns in more readable units.
+    # Each entry is (psutil field, column name, scale factor).
+    _UNIT_CONVERSIONS = (
+        ("read_bytes", "read GB", 1e-9),
+        ("write_bytes", "write GB", 1e-9),
+        ("read_time", "read_time_secs", 1e-3),
+        ("write_time", "write_time_secs", 1e-3),
+        ("busy_time", "busy_time_secs", 1e-3),
+    )
+
     def __init__(self) -> None:
+        super().__init__()
+        self._set_schema_from_fields(_SDISKIO_FIELDS)
+
+    def _set_schema_from_fields(self, fields: Iterable[str]) -> None:
+        """Set the columns to record, given the raw fields returned by the sampler.
+
+        psutil only returns the fields which the OS provides (e.g. `busy_time` and the
+        `*_merged_count` fields are Linux-only). So only record the raw fields which are
+        available, and the derived columns which can be computed from them.
+        """
+        fields = frozenset(fields)
+        self._unit_conversions = tuple(
+            conversion for conversion in self._UNIT_CONVERSIONS if conversion[0] in fields)
+        converted_fields = {field for field, _, _ in self._unit_conversions}
+        directions = ("read", "write")
+        self._iops_directions = tuple(d for d in directions if f"{d}_count" in fields)
+        self._bandwidth_directions = tuple(d for d in directions if f"{d}_bytes" in fields)
+        self._gb_per_time_directions = tuple(
+            d for d in self._bandwidth_directions if f"{d}_time" in fields)
         columns = (
-            # See:
-            # https://psutil.readthedocs.io/en/latest/#psutil.disk_io_counters
-            # https://www.kernel.org/doc/Documentation/iostats.txt
-            psutil._pslinux.sdiskio._fields + # superset of _common.sdiskio._fields
-            ("read_IOPS", "write_IOPS", "avg read GB/sec", "avg write GB/sec",
-             "read GB / read_time_secs", "write GB / write_time_secs",
-             "read GB", "write GB",
-             "read_time_secs", "write_time_secs", "busy_time_secs")
+            [field for field in _SDISKIO_FIELDS
+             if field in fields and field not in converted_fields] +
+            [f"{d}_IOPS" for d in self._iops_directions] +
+            [f"avg {d} GB/sec" for d in self._bandwidth_directions] +
+            [f"{d} GB / {d}_time_secs" for d in self._gb_per_time_directions] +
+            [column for _, column, _ in self._unit_conversions]
         )
-        columns = tuple(
-            col for col in columns if col not in 
-            ("read_bytes", "write_bytes", "read_time", "write_time", "busy_time"))
-        self._data_per_run = pd.DataFrame(dtype=np.int64, columns=columns)
-        self._data_per_run.index.name = "run_ID"
+        # Counts are integers. Everything else is either a rate, or has been converted
+        # to GB or secs, so is a float.
+        self._set_schema(
+            {col: np.int64 if col.endswith("_count") else np.float64 for col in columns})
 
     @property
     def dataset_path(self) -> pathlib.Path:
@@ -147,27 +264,33 @@ class DiskIO(_PerfCounterABC):
     def dataset_path(self, dataset_path: pathlib.Path) -> None:
         self._dataset_path = dataset_path
         self._dataset_partition_name = _get_partition_name_from_path(dataset_path)
-        print("dataset_partition_name =", self._dataset_partition_name)
+        logger.info("dataset_partition_name = %s", self._dataset_partition_name)
+        # Choose how to sample the counters now, rather than on every sample (which would
+        # add a `stat` of /proc/diskstats to the measured window).
+        read_counters = (
+            _read_diskstats if _PROC_DISKSTATS.exists() else _read_psutil_disk_io_counters)
+        self._sample_disk_io_counters = functools.partial(
+            read_counters, self._dataset_partition_name)
+        self._set_schema_from_fields(self._sample_disk_io_counters().keys())
 
     def start_timing_run(self) -> None:
-        self._disk_counters_at_start_of_run = self._get_disk_io_counters_as_series()
+        self._disk_counters_at_start_of_run = self._sample_disk_io_counters()
         
-    def stop_timing_run(self, metrics_for_run: MetricsForRun) -> None:
-        disk_io_counters_at_end_of_run = self._get_disk_io_counters_as_series()
-        count_diff = disk_io_counters_at_end_of_run - self._disk_counters_at_start_of_run
+    def stop_timing_run(self, metrics_for_run: MetricsForRun, total_secs: float) -> None:
+        # Use plain dicts and scalar arithmetic (not pandas), because some of this work
+        # happens inside the measured window.
+        disk_io_counters_at_end_of_run = self._sample_disk_io_counters()
+        start = self._disk_counters_at_start_of_run
+        count_diff: dict[str, float] = {
+            key: end_value - start[key]
+            for key, end_value in disk_io_counters_at_end_of_run.items()}
 
         # Convert bytes to gigabytes, and milliseconds to secs:
-        for direction in ("read", "write"):
-            count_diff[f"{direction} GB"] = count_diff[f"{direction}_bytes"] / 1E9
-            count_diff[f"{direction}_time_secs"] = count_diff[f"{direction}_time"] / 1E3
-            del count_diff[f"{direction}_bytes"]
-            del count_diff[f"{direction}_time"]
-        if "busy_time" in count_diff:
-            count_diff[f"busy_time_secs"] = count_diff[f"busy_time"] / 1E3
-            del count_diff["busy_time"]
+        for field, column, scale in self._unit_conversions:
+            count_diff[column] = count_diff.pop(field) * scale
 
         # Compute {read,write} GB / {read,write}_time(secs)
-        for direction in ("read", "write"):
+        for direction in self._gb_per_time_directions:
             # Protect against divide-by-zero (if <direction>_time is zero):
             new_key = f"{direction} GB / {direction}_time_secs"
             if count_diff[f"{direction}_time_secs"] > 0:
@@ -177,49 +300,85 @@ class DiskIO(_PerfCounterABC):
                 count_diff[new_key] = 0
 
         # Compute counters which depend on runtime:
-        total_secs = metrics_for_run.total_secs
-        count_diff["read_IOPS"] = count_diff["read_count"] / total_secs
-        count_diff["write_IOPS"] = count_diff["write_count"] / total_secs
-        count_diff["avg read GB/sec"] = count_diff["read GB"] / total_secs
-        count_diff["avg write GB/sec"] = count_diff["write GB"] / total_secs
+        for direction in self._iops_directions:
+            count_diff[f"{direction}_IOPS"] = count_diff[f"{direction}_count"] / total_secs
+        for direction in self._bandwidth_directions:
+            count_diff[f"avg {direction} GB/sec"] = count_diff[f"{direction} GB"] / total_secs
 
-        self._data_per_run.loc[metrics_for_run.run_id] = count_diff
-    
-    def _get_disk_io_counters_as_series(self) -> pd.Series:
-        counters: dict[str, namedtuple] = psutil.disk_io_counters(perdisk=True)
-        counters: namedtuple = counters[self._dataset_partition_name]
-        return pd.Series(counters._asdict())
+        self._append_row(metrics_for_run.run_id, count_diff)
     
     @property
     def name(self) -> str:
         return "Disk IO"
+
+
+def _read_psutil_disk_io_counters(partition_name: str) -> dict[str, int]:
+    import psutil
+    counters: dict[str, namedtuple] = psutil.disk_io_counters(perdisk=True, nowrap=False)
+    return counters[partition_name]._asdict()
+
+
+def _read_diskstats(partition_name: str) -> dict[str, int]:
+    """Read the IO counters for a single partition straight from /proc/diskstats (Linux only).
     
-    def get_results(self) -> pd.DataFrame:
-        return self._data_per_run
+    Returns the same fields as `psutil.disk_io_counters(perdisk=True)[partition_name]`, but
+    avoids parsing the stats for every device, and building a named tuple for each device.
+    See https://www.kernel.org/doc/Documentation/iostats.txt for the format.
+    """
+    with open(_PROC_DISKSTATS, mode="r", encoding="ascii") as fh:
+        for line in fh:
+            fields = line.split()
+            if fields[2] == partition_name:
+                (read_count, read_merged_count, read_sectors, read_time,
+                 write_count, write_merged_count, write_sectors, write_time,
+                 _, busy_time) = map(int, fields[3:13])
+                return {
+                    "read_count": read_count,
+                    "write_count": write_count,
+                    "read_bytes": read_sectors * _SECTOR_SIZE_BYTES,
+                    "write_bytes": write_sectors * _SECTOR_SIZE_BYTES,
+                    "read_time": read_time,
+                    "write_time": write_time,
+                    "read_merged_count": read_merged_count,
+                    "write_merged_count": write_merged_count,
+                    "busy_time": busy_time,
+                }
+    raise RuntimeError(f"Could not find partition {partition_name} in {_PROC_DISKSTATS}")
 
 
 class _BasicTimer:
+    """Wall-clock timer, using a monotonic clock (so it's immune to NTP adjustments)."""
     def __init__(self) -> None:
-        self._time_at_start = datetime.now()
+        self._time_at_start = perf_counter_ns()
         
     def total_secs_elapsed(self) -> float:
-        duration = datetime.now() - self._time_at_start
-        return duration.total_seconds()
+        return (perf_counter_ns() - self._time_at_start) * 1e-9
 
 
 def _get_partition_name_from_path(dataset_path: pathlib.Path) -> str:
     dataset_mount_point = _get_mount_point_from_path(dataset_path)
+    return _get_partition_name_from_mount_point(str(dataset_mount_point))
+
+
+@functools.lru_cache(maxsize=128)
+def _get_partition_name_from_mount_point(mount_point: str) -> str:
+    import psutil
     partitions: list[psutil._common.sdiskpart] = psutil.disk_partitions()
     for partition in partitions:
-        if pathlib.Path(partition.mountpoint) == dataset_mount_point:
+        if pathlib.Path(partition.mountpoint) == pathlib.Path(mount_point):
             return pathlib.Path(partition.device).resolve().parts[-1]
-    raise RuntimeError(f"Could not find partition for {dataset_path}")
-            
-        
+    raise RuntimeError(f"Could not find partition for mount point {mount_point}")
+
+
 def _get_mount_point_from_path(p: pathlib.Path) -> pathlib.Path:
-    if len(p.parts) == 0:
-        raise RuntimeError(f"Path '{p}' should not be empty!")
-    elif p.is_mount():
-        return p
-    else:
-        return _get_mount_point_from_path(p.parent)
\ No newline at end of file
+    return pathlib.Path(_get_mount_point_from_resolved_path(str(p.resolve())))
+
+
+@functools.lru_cache(maxsize=128)
+def _get_mount_point_from_resolved_path(resolved_path: str) -> str:
+    p = pathlib.Path(resolved_path)
+    while not p.is_mount():
+        if p == p.parent:
+            raise RuntimeError(f"Could not find mount point for '{resolved_path}'!")
+        p = p.parent
+    return str(p)
@@ -1,23 +1,54 @@
 """Simple utility functions."""
 
 import importlib.util
+import os
 import pathlib
 import sys
+from types import ModuleType
+from typing import Iterator
 
 
 def path_not_empty(path: pathlib.Path) -> bool:
     """Returns True if `path` is not empty."""
     # If `path` contains just a single entry then return True.
-    # To save time, don't bother iterating past the first entry.
-    for _ in path.iterdir():
-        return True
-    return False
+    # To save time, don't bother iterating past the first entry. And use
+    # `os.scandir` to avoid constructing a `pathlib.Path` for that entry.
+    with os.scandir(path) as entries:
+        return next(entries, None) is not None
 
 
-def load_module_from_filename(py_filename: pathlib.Path):
+def iter_files(path: pathlib.Path) -> Iterator[pathlib.Path]:
+    """Yield `path` if it is a file, or every file beneath `path` if it is a directory."""
+    if path.is_dir():
+        for dirpath, _, filenames in os.walk(path):
+            for filename in filenames:
+                yield pathlib.Path(dirpath) / filename
+    else:
+        yield path
+
+
+def load_module_from_filename(py_filename: pathlib.Path) -> ModuleType:
+    """Import the Python file `py_filename` as a module.
+    
+    Each file is only executed once: subsequent calls for the same file return the
+    same module object, unless the file has been modified since it was loaded.
+    """
+    resolved_filename = str(py_filename.resolve())
+    mtime_ns = os.stat(resolved_filename).st_mtime_ns
+    cached = _modules_by_filename.get(resolved_filename)
+    if cached is not None and cached[0] == mtime_ns:
+        return cached[1]
     module_name = py_filename.stem
     spec = importlib.util.spec_from_file_location(module_name, py_filename)
     module = importlib.util.module_from_spec(spec)
     sys.modules[module_name] = module
     spec.loader.exec_module(module)
+    _modules_by_filename[resolved_filename] = (mtime_ns, module)
     return module
+
+
+# Maps the resolved filename of each module loaded by `load_module_from_filename`
+# to the file's modification time (in ns) when it was loaded, and the module.
+# Keyed by filename (not module name) so that two recipe files with the same stem
+# in different directories don't collide.
+_modules_by_filename: dict[str, tuple[int, ModuleType]] = {}
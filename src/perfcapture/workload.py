@@ -1,22 +1,58 @@
+from __future__ import annotations
+
 import abc
+import concurrent.futures
+import functools
 import inspect
+import logging
+import os
 import pathlib
-import subprocess
+import sys
+import weakref
+from collections import defaultdict
+from types import ModuleType
+from typing import TYPE_CHECKING, Callable
+
+from perfcapture import cache
+from perfcapture.utils import load_module_from_filename
+
+# These are only needed for type annotations, or by `run_workloads`, so don't import them
+# (and hence pandas) when recipe modules merely subclass `Workload`.
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
 
-import pandas as pd
+    from perfcapture.dataset import Dataset
+    from perfcapture.metrics import MetricsForRun
+    from perfcapture.performance_counters import PerfCounterManager
 
-from perfcapture.dataset import Dataset
-from perfcapture.metrics import MetricsForRun
-from perfcapture.performance_counters import PerfCounterManager
-from perfcapture.utils import load_module_from_filename, path_not_empty
+logger = logging.getLogger(__name__)
 
 
 class Workload(abc.ABC):
     """Inherit from `Workload` to implement a new benchmark workload."""
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        """Register each subclass against the module which defines it."""
+        super().__init_subclass__(**kwargs)
+        # Register every subclass, so `load_workloads_from_filename` can find the workloads
+        # defined in a module without searching through all of the module's attributes.
+        # Key on the module object, not its name, because recipe modules in different
+        # directories can have the same name.
+        module = sys.modules.get(cls.__module__)
+        if module is not None:
+            _workload_classes.setdefault(module, {})[cls.__qualname__] = cls
     
-    def __init__(self):
-        self.datasets = self.init_datasets()
+    @functools.cached_property
+    def datasets(self) -> tuple[Dataset, ...]:
+        """The datasets used by this workload, as returned by `init_datasets()`.
         
+        `init_datasets()` is only called when `datasets` is first accessed, so workloads
+        which are discovered but never run (e.g. because they're filtered out) never
+        construct their datasets. Assign to `datasets` to replace them.
+        """
+        return self.init_datasets()
+
     @abc.abstractmethod
     def init_datasets(self) -> tuple[Dataset, ...]:
         """Initialises and returns a tuple of concrete Dataset objects.
@@ -29,8 +65,34 @@ class Workload(abc.ABC):
         """Run this workload once against a specific dataset.
         
         Must be overridden to implement the workload.
+        
+        If your workload uses a JIT compiler (e.g. Numba's `@njit`) then enable its on-disk
+        cache (e.g. `@njit(cache=True)`), and give an explicit signature if the argument
+        types vary. Otherwise every invocation of the benchmark re-compiles the code, and
+        the compilation time is included in the measured runtime of the first run.
         """
 
+    def run_repeats(
+        self,
+        dataset_path: pathlib.Path,
+        n_runs: int,
+        measure: Callable[[Callable[[], MetricsForRun]], None],
+        ) -> None:
+        """Run this workload `n_runs` times against a specific dataset.
+        
+        `measure` is supplied by the workload runner. It takes a function which runs the
+        workload once (and returns a `MetricsForRun`), prepares for the run (e.g. by evicting
+        the dataset from the page cache), and then times and records that function call.
+        
+        The default implementation calls `measure` with `run` `n_runs` times. Override this
+        method if some setup work (e.g. parsing metadata) can be shared between runs. Only
+        the work done inside the function passed to `measure` is timed. `measure` must not be
+        called more than `n_runs` times (it raises `RuntimeError` if it is), so do any untimed
+        warm-up runs without `measure`.
+        """
+        for _ in range(n_runs):
+            measure(lambda: self.run(dataset_path))
+
     @property
     def name(self) -> str:
         """Return the name of this workload.
@@ -44,57 +106,195 @@ class Workload(abc.ABC):
         """The number of times to repeat this workload."""
         return 3
 
+    @property
+    def cache_mode(self) -> cache.CacheMode:
+        """How to prepare the page cache before each run of this workload.
+        
+        Defaults to `CacheMode.COLD`. Override to return `CacheMode.TOUCH` to measure
+        the workload with its dataset already in the page cache.
+        """
+        return cache.CacheMode.COLD
+
 
 def load_workloads_from_filename(py_filename: pathlib.Path) -> list[Workload]:
+    """Instantiate every concrete `Workload` subclass defined in `py_filename`.
+    
+    The module is only executed once (see `load_module_from_filename`), but every call
+    returns new workload instances, so no state is shared between calls.
+    """
     workloads = []
     module = load_module_from_filename(py_filename)
-    for member_name in dir(module):
-        module_attr = getattr(module, member_name)
-        if (module_attr 
-            and inspect.isclass(module_attr) 
-            and issubclass(module_attr, Workload) 
-            and module_attr is not Workload
-            ):
-            print(f"Instantiating {member_name}")
-            workload_obj = module_attr()
-            workloads.append(workload_obj)
+    module_vars = vars(module)
+    for qualname, workload_class in _workload_classes.get(module, {}).items():
+        # Skip classes which aren't bound to their name at the top level of the module
+        # (e.g. classes defined inside functions), and abstract base classes.
+        if module_vars.get(qualname) is not workload_class or inspect.isabstract(workload_class):
+            continue
+        logger.info("Instantiating %s", qualname)
+        workloads.append(workload_class())
     return workloads
 
+
+# Maps each module to the `Workload` subclasses defined in that module, keyed by their
+# `__qualname__`. Populated by `Workload.__init_subclass__`. Modules are held weakly, so
+# entries disappear when a module is replaced (e.g. because its file has been modified).
+_workload_classes: weakref.WeakKeyDictionary[ModuleType, dict[str, type[Workload]]] = (
+    weakref.WeakKeyDictionary())
+
+
+def discover_workloads(recipe_path: pathlib.Path) -> list[Workload]:
+    """Load every recipe module in `recipe_path`, and return all the workloads they define.
     
-def discover_workloads(recipe_path: pathlib.Path) -> list[Workload]:    
-    # First, load any dataset modules, so they're available for the workload modules:
-    for py_filename in recipe_path.glob("*dataset*.py"):
-        workloads_from_py_file = load_workloads_from_filename(py_filename)
+    Each module is loaded once. Modules with "dataset" in their filename are loaded first,
+    so they're available for the workload modules. Files starting with "_" or "." are skipped.
+    
+    `recipe_path` is added to `sys.path` (once), so recipe modules can import other modules
+    in `recipe_path`, such as private helper modules.
+    """
+    recipe_dir = os.path.realpath(recipe_path)
+    if recipe_dir not in sys.path:
+        sys.path.append(recipe_dir)
+
+    with os.scandir(recipe_path) as entries:
+        py_entries = [
+            entry for entry in entries
+            if entry.name.endswith(".py")
+            and not entry.name.startswith(("_", "."))
+            and entry.is_file()
+            ]
+    py_entries.sort(key=lambda entry: ("dataset" not in entry.name, entry.name))
 
     workloads = []
-    for py_filename in recipe_path.glob("*.py"):
-        workloads_from_py_file = load_workloads_from_filename(py_filename)
-        workloads.extend(workloads_from_py_file)
+    seen: set[str] = set()  # Resolved paths, in case any recipe files are symlinks.
+    for entry in py_entries:
+        resolved_path = os.path.realpath(entry.path)
+        if resolved_path in seen:
+            continue
+        seen.add(resolved_path)
+        workloads.extend(load_workloads_from_filename(pathlib.Path(entry.path)))
     return workloads
-        
+
 
 def run_workloads(
     workloads: list[Workload],
     keep_cache: bool
     ) -> pd.DataFrame:
-    all_results = []
-    for workload in workloads:
-        for dataset in workload.datasets:
-            print(f"Running {workload.name} {workload.n_runs} times on {dataset.name}!")
-            perf_counter = PerfCounterManager(dataset.path)
-            for i in range(workload.n_runs):
-                print(f"Run {i+1} of {workload.n_runs}...")
-                if not keep_cache:
-                    p = subprocess.run(
-                        ["vmtouch", "-e", dataset.path], capture_output=True, check=True)
-                perf_counter.start_timing_run()
-                metrics_for_run = workload.run(dataset_path=dataset.path)
-                perf_counter.stop_timing_run(metrics_for_run)
-            print(f"Finished!\n{perf_counter}\n")
+    import numpy as np
+    import pandas as pd
+
+    from perfcapture.performance_counters import PerfCounterManager
+
+    runs = [(workload, dataset) for workload in workloads for dataset in workload.datasets]
+    # Accumulate the results column-by-column, and build a single DataFrame at the end.
+    workload_names: list[str] = []
+    dataset_names: list[str] = []
+    run_ids: list[np.ndarray] = []
+    metrics: defaultdict[str, list[np.ndarray]] = defaultdict(list)
+    prepare_cache_funcs = [
+        _get_prepare_cache_func(workload.cache_mode, keep_cache) for workload, _ in runs]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        preparation = None
+        if runs:
+            preparation = _submit_if_not_none(executor, prepare_cache_funcs[0], runs[0][1].path)
+        for i, (workload, dataset) in enumerate(runs):
+            # Look up these (possibly computed) properties once per dataset.
+            workload_name = workload.name
+            n_runs = workload.n_runs
+            dataset_name = dataset.name
+            dataset_path = dataset.path
+
+            logger.info("Running %s %d times on %s!", workload_name, n_runs, dataset_name)
+            perf_counter = PerfCounterManager(dataset_path, n_runs=n_runs)
+            measure = _MeasureRun(
+                perf_counter, dataset_path, n_runs, prepare_cache_funcs[i], preparation, executor)
+            workload.run_repeats(dataset_path, n_runs, measure)
+
+            # Start preparing the page cache for the next dataset now, so that overlaps
+            # with post-processing the results for this dataset.
+            if i + 1 < len(runs):
+                preparation = _submit_if_not_none(
+                    executor, prepare_cache_funcs[i + 1], runs[i + 1][1].path)
+
+            logger.info("Finished!\n%s\n", perf_counter)
 
             # Store results
-            results = perf_counter.get_results().reset_index()
-            results['workload'] = workload.name
-            results['dataset'] = dataset.name
-            all_results.append(results)
-    return pd.concat(all_results).set_index(["workload", "dataset", "run_ID"])
+            results = perf_counter.get_results()
+            workload_names.extend([workload_name] * len(results))
+            dataset_names.extend([dataset_name] * len(results))
+            run_ids.append(results.index.to_numpy())
+            for column_name, column in results.items():
+                metrics[column_name].append(column.to_numpy())
+
+    index = pd.MultiIndex.from_arrays(
+        [workload_names, dataset_names, np.concatenate(run_ids)],
+        names=["workload", "dataset", "run_ID"],
+        )
+    return pd.DataFrame(
+        {column_name: np.concatenate(chunks) for column_name, chunks in metrics.items()},
+        index=index,
+        copy=False,
+        )
+
+
+def _get_prepare_cache_func(
+    cache_mode: cache.CacheMode,
+    keep_cache: bool,
+    ) -> Callable[[pathlib.Path], None] | None:
+    """Returns the function to call on the dataset path before each run, if any."""
+    if cache_mode is cache.CacheMode.TOUCH:
+        return cache.touch
+    if cache_mode is cache.CacheMode.COLD and not keep_cache:
+        return cache.evict
+    return None
+
+
+def _submit_if_not_none(
+    executor: concurrent.futures.Executor,
+    func: Callable[[pathlib.Path], None] | None,
+    path: pathlib.Path,
+    ) -> concurrent.futures.Future | None:
+    return None if func is None else executor.submit(func, path)
+
+
+class _MeasureRun:
+    """The `measure` callback passed to `Workload.run_repeats`.
+    
+    Before each run, `prepare_cache` (e.g. `cache.evict`) is called on the dataset path,
+    unless `prepare_cache` is None. `first_preparation` is the (already submitted) call for
+    the first run. The call for run i+1 is submitted to `executor` as soon as run i stops,
+    so it overlaps with post-processing of run i.
+    """
+    def __init__(
+        self,
+        perf_counter: PerfCounterManager,
+        dataset_path: pathlib.Path,
+        n_runs: int,
+        prepare_cache: Callable[[pathlib.Path], None] | None,
+        first_preparation: concurrent.futures.Future | None,
+        executor: concurrent.futures.Executor,
+        ) -> None:
+        self._perf_counter = perf_counter
+        self._dataset_path = dataset_path
+        self._n_runs = n_runs
+        self._prepare_cache = prepare_cache
+        self._executor = executor
+        self._i = 0
+        self._preparation = first_preparation
+
+    def __call__(self, run_once: Callable[[], MetricsForRun]) -> None:
+        if self._i == self._n_runs:
+            # The page cache is only prepared for `n_runs` runs, so any extra run would be
+            # measured with whatever the previous run left in the page cache.
+            raise RuntimeError(
+                f"`measure` was called more than n_runs={self._n_runs} times. Workloads which"
+                " override `run_repeats` must call `measure` at most `n_runs` times (call"
+                " the workload directly for any untimed warm-up runs).")
+        self._i += 1
+        logger.info("Run %d of %d...", self._i, self._n_runs)
+        if self._preparation is not None:
+            self._preparation.result()  # Ensure the cache is ready before we start timing.
+        self._perf_counter.start_timing_run()
+        metrics_for_run = run_once()
+        self._perf_counter.stop_timing_run(metrics_for_run)
+        if self._prepare_cache is not None and self._i < self._n_runs:
+            self._preparation = self._executor.submit(self._prepare_cache, self._dataset_path)
@@ -0,0 +1,60 @@
+from perfcapture import cache
+import os
+import pathlib
+
+import pytest
+
+def test_evict_and_warm(tmp_path: pathlib.Path):
+    """Test that cache.evict and cache.warm accept both files and directories.
+    
+    Args:
+        tmp_path: See https://docs.pytest.org/en/7.4.x/how-to/tmp_path.html
+    """
+    filenames = [tmp_path / f"file{i}.bin" for i in range(3)]
+    for filename in filenames:
+        filename.write_bytes(b"\0" * 8192)
+    for path in (filenames[0], tmp_path):
+        cache.warm(path)
+        cache.evict(path)
+    
+    # The contents of the files must not be changed.
+    assert all(filename.read_bytes() == b"\0" * 8192 for filename in filenames)
+
+
+def test_touch(tmp_path: pathlib.Path):
+    """Test that cache.touch reads every file without modifying it.
+    
+    Args:
+        tmp_path: See https://docs.pytest.org/en/7.4.x/how-to/tmp_path.html
+    """
+    filename = tmp_path / "file.bin"
+    contents = bytes(range(256)) * 10_000
+    filename.write_bytes(contents)
+    cache.touch(tmp_path)
+    cache.touch(filename)
+    assert filename.read_bytes() == contents
+
+
+def test_evict_raises_if_unsupported(tmp_path: pathlib.Path, monkeypatch):
+    """Test that cache.evict raises, rather than silently doing nothing, if it can't evict.
+    
+    Args:
+        tmp_path: See https://docs.pytest.org/en/7.4.x/how-to/tmp_path.html
+        monkeypatch: See https://docs.pytest.org/en/7.4.x/how-to/monkeypatch.html
+    """
+    monkeypatch.delattr(os, "posix_fadvise")
+    monkeypatch.delenv(cache._USE_VMTOUCH_ENV_VAR, raising=False)
+    assert not cache.can_evict()
+    with pytest.raises(RuntimeError):
+        cache.evict(tmp_path)
+
+
+def test_can_evict_without_vmtouch(monkeypatch):
+    """Test that cache.can_evict is False if vmtouch is requested but not installed.
+    
+    Args:
+        monkeypatch: See https://docs.pytest.org/en/7.4.x/how-to/monkeypatch.html
+    """
+    monkeypatch.setenv(cache._USE_VMTOUCH_ENV_VAR, "1")
+    monkeypatch.setattr(cache, "_VMTOUCH", None)
+    assert not cache.can_evict()
@@ -0,0 +1,72 @@
+from perfcapture import performance_counters
+from perfcapture.metrics import MetricsForRun
+import itertools
+import pathlib
+from collections import namedtuple
+
+
+def test_perf_counter_manager(tmp_path: pathlib.Path):
+    """Test that PerfCounterManager records one row per run.
+    
+    Args:
+        tmp_path: See https://docs.pytest.org/en/7.4.x/how-to/tmp_path.html
+    """
+    perf_counter = performance_counters.PerfCounterManager(
+        tmp_path,
+        counters=[performance_counters.Runtime(), performance_counters.BandwidthToNumpy()],
+        n_runs=2,  # Record more runs than reserved, to test that the storage grows.
+        )
+    n_runs = 3
+    for _ in range(n_runs):
+        perf_counter.start_timing_run()
+        perf_counter.stop_timing_run(MetricsForRun(nbytes_in_final_array=1_000_000))
+    
+    results = perf_counter.get_results()
+    assert list(results.columns) == ["Runtime in secs", "GB/sec to numpy"]
+    assert list(results.index) == [1, 2, 3]
+    assert results.index.name == "run_ID"
+    assert (results["Runtime in secs"] > 0).all()
+    
+    summary = perf_counter.get_summary_of_results()
+    assert list(summary.columns) == ["mean", "std"]
+    assert list(summary.index) == ["Runtime in secs", "GB/sec to numpy"]
+
+
+def test_disk_io_with_reduced_psutil_fields(tmp_path: pathlib.Path, monkeypatch):
+    """Test DiskIO on platforms where psutil doesn't return the Linux-only fields.
+    
+    Args:
+        tmp_path: See https://docs.pytest.org/en/7.4.x/how-to/tmp_path.html
+        monkeypatch: See https://docs.pytest.org/en/7.4.x/how-to/monkeypatch.html
+    """
+    import psutil
+
+    # The fields returned by psutil on macOS and Windows.
+    sdiskio = namedtuple(
+        "sdiskio",
+        ["read_count", "write_count", "read_bytes", "write_bytes", "read_time", "write_time"])
+    n_calls = itertools.count(1)
+
+    def disk_io_counters(perdisk: bool, nowrap: bool) -> dict[str, tuple]:
+        i = next(n_calls)
+        return {"disk0": sdiskio(10 * i, i, 4096 * i, 512 * i, 2 * i, i)}
+
+    monkeypatch.setattr(performance_counters, "_PROC_DISKSTATS", tmp_path / "missing")
+    monkeypatch.setattr(
+        performance_counters, "_get_partition_name_from_path", lambda path: "disk0")
+    monkeypatch.setattr(psutil, "disk_io_counters", disk_io_counters)
+
+    disk_io = performance_counters.DiskIO()
+    disk_io.dataset_path = tmp_path
+    disk_io.start_timing_run()
+    disk_io.stop_timing_run(MetricsForRun(nbytes_in_final_array=1, run_id=1), total_secs=2.0)
+
+    results = disk_io.get_results()
+    assert "busy_time_secs" not in results.columns
+    assert "read_merged_count" not in results.columns
+    row = results.loc[1]
+    assert row["read_count"] == 10
+    assert row["read_IOPS"] == 5
+    assert row["read GB"] == 4096e-9
+    assert row["read_time_secs"] == 2e-3
+    assert row["read GB / read_time_secs"] == 4096e-9 / 2e-3
@@ -0,0 +1,139 @@
+from perfcapture import utils
+import errno
+import os
+import pathlib
+
+import numpy as np
+import pytest
+
+read_numpy_file = utils.load_module_from_filename(
+    pathlib.Path(__file__).parent.parent / "examples" / "read_numpy_file.py")
+
+_SHAPE = (3, 5, 7)
+
+_LOAD_KWARGS = [
+    dict(),
+    dict(use_direct_io=True),
+    dict(use_mmap=True),
+    dict(use_mmap=True, prefault_mmap=True),
+    ]
+
+
+def _create_dataset(base_path: pathlib.Path, shape=_SHAPE, source=None):
+    dataset = read_numpy_file.NumpyDataset()
+    dataset.shape = shape
+    dataset._source_cache_path = source
+    dataset.set_path(base_path)
+    dataset.create()
+    return dataset
+
+
+def test_create_numpy_dataset(tmp_path: pathlib.Path):
+    """Test that NumpyDataset.create writes a page-aligned NPY file, and a matching sidecar.
+
+    Args:
+        tmp_path: See https://docs.pytest.org/en/7.4.x/how-to/tmp_path.html
+    """
+    dataset = _create_dataset(tmp_path)
+    npy_path = dataset.path / read_numpy_file._NPY_FILENAME
+    assert read_numpy_file._sidecar_path(npy_path).exists()
+
+    layout = read_numpy_file._get_npy_layout(npy_path)
+    assert layout == read_numpy_file._read_npy_header(npy_path)
+    data_offset, dtype, shape, order = layout
+    assert data_offset % read_numpy_file._DIRECT_IO_ALIGNMENT == 0
+    assert (dtype, shape, order) == (np.dtype(np.uint8), _SHAPE, "C")
+
+    expected = np.load(npy_path)
+    assert expected.shape == _SHAPE
+    assert os.path.getsize(npy_path) == data_offset + expected.nbytes
+
+
+@pytest.mark.parametrize("kwargs", _LOAD_KWARGS)
+def test_fast_load_npy(tmp_path: pathlib.Path, kwargs: dict):
+    """Test that _fast_load_npy matches np.load, for a file written by NumpyDataset.
+
+    Args:
+        tmp_path: See https://docs.pytest.org/en/7.4.x/how-to/tmp_path.html
+        kwargs: The keyword arguments to pass to _fast_load_npy.
+    """
+    dataset = _create_dataset(tmp_path)
+    npy_path = dataset.path / read_numpy_file._NPY_FILENAME
+    np.testing.assert_array_equal(
+        read_numpy_file._fast_load_npy(npy_path, **kwargs), np.load(npy_path))
+
+
+@pytest.mark.parametrize("kwargs", _LOAD_KWARGS)
+def test_fast_load_npy_without_sidecar(tmp_path: pathlib.Path, kwargs: dict):
+    """Test that _fast_load_npy matches np.load for an F-order, big-endian file with no sidecar.
+
+    Args:
+        tmp_path: See https://docs.pytest.org/en/7.4.x/how-to/tmp_path.html
+        kwargs: The keyword arguments to pass to _fast_load_npy.
+    """
+    npy_path = tmp_path / "data.npy"
+    array = np.asfortranarray(np.arange(np.prod(_SHAPE), dtype=">i4").reshape(_SHAPE))
+    np.save(npy_path, array)
+    assert not read_numpy_file._sidecar_path(npy_path).exists()
+
+    loaded = read_numpy_file._fast_load_npy(npy_path, **kwargs)
+    assert loaded.dtype == np.dtype(">i4")
+    assert loaded.flags.f_contiguous
+    np.testing.assert_array_equal(loaded, np.load(npy_path))
+
+
+def test_rewritten_sidecar_is_picked_up(tmp_path: pathlib.Path):
+    """Test that _get_npy_layout doesn't return a stale layout after the dataset is recreated.
+
+    Args:
+        tmp_path: See https://docs.pytest.org/en/7.4.x/how-to/tmp_path.html
+    """
+    dataset = _create_dataset(tmp_path)
+    npy_path = dataset.path / read_numpy_file._NPY_FILENAME
+    assert read_numpy_file._get_npy_layout(npy_path)[2] == _SHAPE
+
+    new_shape = (11, 13)
+    _create_dataset(tmp_path, shape=new_shape)
+    assert read_numpy_file._get_npy_layout(npy_path)[2] == new_shape
+    np.testing.assert_array_equal(read_numpy_file._fast_load_npy(npy_path), np.load(npy_path))
+
+
+@pytest.mark.skipif(not hasattr(os, "copy_file_range"), reason="needs os.copy_file_range")
+def test_create_copies_source(tmp_path: pathlib.Path):
+    """Test that NumpyDataset.create copies `_source_cache_path`, if it's set.
+
+    Args:
+        tmp_path: See https://docs.pytest.org/en/7.4.x/how-to/tmp_path.html
+    """
+    source = tmp_path / "source.npy"
+    array = np.arange(24, dtype=np.float32).reshape(4, 6)
+    np.save(source, array)
+
+    dataset = _create_dataset(tmp_path / "data", source=source)
+    npy_path = dataset.path / read_numpy_file._NPY_FILENAME
+    assert npy_path.read_bytes() == source.read_bytes()
+    assert read_numpy_file._get_npy_layout(npy_path) == read_numpy_file._read_npy_header(npy_path)
+    np.testing.assert_array_equal(read_numpy_file._fast_load_npy(npy_path), array)
+
+
+@pytest.mark.skipif(not hasattr(os, "copy_file_range"), reason="needs os.copy_file_range")
+def test_create_falls_back_if_copy_fails(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch):
+    """Test that NumpyDataset.create generates the array if copying `_source_cache_path` fails.
+
+    Args:
+        tmp_path: See https://docs.pytest.org/en/7.4.x/how-to/tmp_path.html
+        monkeypatch: See https://docs.pytest.org/en/7.4.x/how-to/monkeypatch.html
+    """
+    source = tmp_path / "source.npy"
+    np.save(source, np.arange(24, dtype=np.float32))
+
+    def copy_file_range(*args, **kwargs):
+        raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+
+    monkeypatch.setattr(os, "copy_file_range", copy_file_range)
+    dataset = _create_dataset(tmp_path / "data", source=source)
+    npy_path = dataset.path / read_numpy_file._NPY_FILENAME
+    layout = read_numpy_file._get_npy_layout(npy_path)
+    assert layout[0] % read_numpy_file._DIRECT_IO_ALIGNMENT == 0
+    assert layout[1:] == (np.dtype(np.uint8), _SHAPE, "C")
+    np.testing.assert_array_equal(read_numpy_file._fast_load_npy(npy_path), np.load(npy_path))
@@ -1,4 +1,5 @@
 from perfcapture import utils
+import os
 import pathlib
 
 def test_path_not_empty(tmp_path: pathlib.Path):
@@ -20,4 +21,43 @@ def test_path_not_empty(tmp_path: pathlib.Path):
     # Add another file
     filename2 = d / ".foo"
     filename2.write_text("TEST", encoding="utf-8")
-    assert utils.path_not_empty(d)
\ No newline at end of file
+    assert utils.path_not_empty(d)
+
+def test_iter_files(tmp_path: pathlib.Path):
+    """Test utils.iter_files.
+    
+    Args:
+        tmp_path: See https://docs.pytest.org/en/7.4.x/how-to/tmp_path.html
+    """
+    # A single file yields just itself.
+    filename = tmp_path / "file.txt"
+    filename.write_text("TEST", encoding="utf-8")
+    assert list(utils.iter_files(filename)) == [filename]
+    
+    # A directory yields every file beneath it, including files in subdirectories.
+    subdir = tmp_path / "sub"
+    subdir.mkdir()
+    filename2 = subdir / "file2.txt"
+    filename2.write_text("TEST", encoding="utf-8")
+    assert sorted(utils.iter_files(tmp_path)) == sorted([filename, filename2])
+
+
+def test_load_module_from_filename(tmp_path: pathlib.Path):
+    """Test that utils.load_module_from_filename only executes each file once.
+    
+    Args:
+        tmp_path: See https://docs.pytest.org/en/7.4.x/how-to/tmp_path.html
+    """
+    py_filename = tmp_path / "recipe_for_utils_test.py"
+    py_filename.write_text("import itertools\nCOUNTER = itertools.count()\n", encoding="utf-8")
+    module = utils.load_module_from_filename(py_filename)
+    assert next(module.COUNTER) == 0
+    
+    # Loading the same file again returns the cached module, without re-executing it.
+    assert utils.load_module_from_filename(py_filename) is module
+    assert next(module.COUNTER) == 1
+    
+    # Modifying the file causes it to be re-executed.
+    py_filename.write_text("COUNTER = 'modified'\n", encoding="utf-8")
+    os.utime(py_filename, ns=(0, 0))
+    assert utils.load_module_from_filename(py_filename).COUNTER == "modified"
@@ -0,0 +1,185 @@
+from perfcapture import cache, performance_counters, workload
+from perfcapture.dataset import Dataset
+from perfcapture.metrics import MetricsForRun
+import concurrent.futures
+import os
+import pathlib
+import time
+
+import numpy as np
+import pytest
+
+_RECIPE = '''
+import abc
+from perfcapture.workload import Workload
+
+class AbstractWorkload(Workload):
+    @abc.abstractmethod
+    def extra(self): ...
+
+class {name}(AbstractWorkload):
+    def init_datasets(self):
+        return ()
+    def run(self, dataset_path):
+        pass
+    def extra(self):
+        pass
+'''
+
+def test_load_workloads_from_filename(tmp_path: pathlib.Path):
+    """Test that workload.load_workloads_from_filename finds only concrete workloads.
+    
+    Args:
+        tmp_path: See https://docs.pytest.org/en/7.4.x/how-to/tmp_path.html
+    """
+    py_filename = tmp_path / "recipe_for_workload_test.py"
+    py_filename.write_text(_RECIPE.format(name="MyWorkload"), encoding="utf-8")
+    workloads = workload.load_workloads_from_filename(py_filename)
+    assert [w.name for w in workloads] == ["MyWorkload"]
+    
+    # Loading the same file again returns a new instance of the same class.
+    reloaded_workloads = workload.load_workloads_from_filename(py_filename)
+    assert type(reloaded_workloads[0]) is type(workloads[0])
+    assert reloaded_workloads[0] is not workloads[0]
+    
+    # Classes which are removed from the file are no longer found.
+    py_filename.write_text(_RECIPE.format(name="RenamedWorkload"), encoding="utf-8")
+    os.utime(py_filename, ns=(0, 0))
+    assert [w.name for w in workload.load_workloads_from_filename(py_filename)] == [
+        "RenamedWorkload"]
+
+
+def test_discover_workloads_with_same_module_names(tmp_path: pathlib.Path):
+    """Test that recipe modules with the same filename in different directories don't collide.
+    
+    Args:
+        tmp_path: See https://docs.pytest.org/en/7.4.x/how-to/tmp_path.html
+    """
+    recipe_dirs = {}
+    for dir_name in ("a", "b"):
+        recipe_dirs[dir_name] = tmp_path / dir_name
+        recipe_dirs[dir_name].mkdir()
+        (recipe_dirs[dir_name] / "recipe_for_workload_test_collision.py").write_text(
+            _RECIPE.format(name="MyWorkload"), encoding="utf-8")
+    workload_classes = {}
+    for dir_name in ("a", "b", "a"):
+        workloads = workload.discover_workloads(recipe_dirs[dir_name])
+        assert len(workloads) == 1
+        assert type(workloads[0]) is workload_classes.setdefault(dir_name, type(workloads[0]))
+    assert workload_classes["a"] is not workload_classes["b"]
+
+
+class _FakeDataset(Dataset):
+    def __init__(self, name: str):
+        self._name = name
+
+    def create(self) -> None:
+        pass
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+
+class _ColdWorkload(workload.Workload):
+    def init_datasets(self):
+        return (_FakeDataset("dataset1"), _FakeDataset("dataset2"))
+
+    def run(self, dataset_path):
+        return MetricsForRun(nbytes_in_final_array=1_000)
+
+
+class _TouchWorkload(_ColdWorkload):
+    def init_datasets(self):
+        return (_FakeDataset("dataset1"), )
+
+    @property
+    def cache_mode(self):
+        return cache.CacheMode.TOUCH
+
+
+@pytest.mark.parametrize("keep_cache", [False, True])
+def test_run_workloads(tmp_path: pathlib.Path, monkeypatch, keep_cache: bool):
+    """Test that run_workloads prepares the page cache before (and only before) each run.
+    
+    Args:
+        tmp_path: See https://docs.pytest.org/en/7.4.x/how-to/tmp_path.html
+        monkeypatch: See https://docs.pytest.org/en/7.4.x/how-to/monkeypatch.html
+        keep_cache: Whether to leave the page cache alone for `CacheMode.COLD` workloads.
+    """
+    # Record every cache preparation (when it completes), and every start of a timed run.
+    events = []
+
+    def record_preparation(kind):
+        def prepare(path):
+            time.sleep(0.01)  # Give the runner a chance to start timing too early.
+            events.append((kind, path.name))
+        return prepare
+
+    perf_counter_manager_class = performance_counters.PerfCounterManager
+
+    def make_perf_counter(dataset_path, n_runs):
+        perf_counter = perf_counter_manager_class(
+            dataset_path,
+            counters=[performance_counters.Runtime(), performance_counters.BandwidthToNumpy()],
+            n_runs=n_runs,
+            )
+        start_timing_run = perf_counter.start_timing_run
+
+        def recording_start_timing_run():
+            events.append(("start", dataset_path.name))
+            start_timing_run()
+
+        perf_counter.start_timing_run = recording_start_timing_run
+        return perf_counter
+
+    monkeypatch.setattr(cache, "evict", record_preparation("evict"))
+    monkeypatch.setattr(cache, "touch", record_preparation("touch"))
+    monkeypatch.setattr(performance_counters, "PerfCounterManager", make_perf_counter)
+
+    workloads = [_ColdWorkload(), _TouchWorkload()]
+    for w in workloads:
+        for dataset in w.datasets:
+            dataset.set_path(tmp_path)
+    results = workload.run_workloads(workloads, keep_cache=keep_cache)
+
+    # Each run's preparation must complete before that run starts, and nothing must be
+    # prepared after the last run of each dataset.
+    n_runs = workloads[0].n_runs
+    assert n_runs == 3
+    cold_preparation = [] if keep_cache else [("evict", "dataset1")]
+    expected_events = (
+        (cold_preparation + [("start", "dataset1")]) * n_runs +
+        ([(kind, "dataset2") for kind, _ in cold_preparation] + [("start", "dataset2")]) * n_runs +
+        [("touch", "dataset1"), ("start", "dataset1")] * n_runs
+        )
+    assert events == expected_events
+
+    assert results.index.names == ["workload", "dataset", "run_ID"]
+    assert list(results.index) == (
+        [("_ColdWorkload", "dataset1", run_id) for run_id in (1, 2, 3)] +
+        [("_ColdWorkload", "dataset2", run_id) for run_id in (1, 2, 3)] +
+        [("_TouchWorkload", "dataset1", run_id) for run_id in (1, 2, 3)]
+        )
+    assert list(results.columns) == ["Runtime in secs", "GB/sec to numpy"]
+    assert (results.dtypes == np.float64).all()
+
+
+def test_measure_called_too_many_times(tmp_path: pathlib.Path):
+    """Test that a `run_repeats` override can't record more than `n_runs` runs.
+    
+    Args:
+        tmp_path: See https://docs.pytest.org/en/7.4.x/how-to/tmp_path.html
+    """
+    perf_counter = performance_counters.PerfCounterManager(
+        tmp_path, counters=[performance_counters.Runtime()])
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        measure = workload._MeasureRun(
+            perf_counter, tmp_path, 2, cache.touch, executor.submit(cache.touch, tmp_path),
+            executor)
+        run_once = lambda: MetricsForRun(nbytes_in_final_array=1)
+        measure(run_once)
+        measure(run_once)
+        with pytest.raises(RuntimeError):
+            measure(run_once)
+    assert len(perf_counter.get_results()) == 2